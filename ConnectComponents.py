@@ -1,41 +1,22 @@
 import numpy as np
-import sys
 import scipy
 from scipy import spatial  #For cKDTree
+from scipy import sparse   #For csr_matrix
+from scipy.sparse import csgraph  #For minimum_spanning_tree
 
 
 
-def build_cKDTree(components):
-	"""Generate 2d-trees for each connected component to speed up searches
-	
-	Using the given list of coordinates per connected component, build 
-	 individual 2d-trees (kd-tree) for each component to speed up 
-	 nearest-neighbor searches
-	
-	
-	Args:
-		components (dict): Dictonary containing coordinates per connected component
-	
-	Returns: 
-		dict: Dictionary containing 2d-trees per connected component
-	"""
-	
-	trees = dict()
-	for comp in components:
-		trees[comp] = spatial.cKDTree(components[comp])
-	
-	return trees
-
-
-#------------------------------------------------------------------------------
-
-
-def build_shortest_dist_matrix(components, trees):
+def build_shortest_dist_matrix(pts, labels):
 	"""Build an adjacency matrix between all components using shortest dist
-	
+
 	Build an adjacency matrix between all components, using the shortest
 	 distance between two respective components as an edge
-	
+
+	Rather than querying a separate 2d-tree for every ordered component pair
+	 (O(N^2) query sessions, each with fixed Python/scipy overhead), build one
+	 global 2d-tree over every edge pixel and batch-query each component's
+	 points against it, masking out same-component hits with a label array
+
 	Notes for improvement: - - - - - - - - - - - - - - - - - - - - - - - - - -
 	Could also weight the cost based on whether the start and end points are 
 	 a line segment end or not here for better end results
@@ -56,107 +37,226 @@ def build_shortest_dist_matrix(components, trees):
 	
 	
 	Args:
-		components (dict): Dictonary containing coordinates per connected component
-		trees (dict): Dictionary containing 2d-trees per connected component
-	
-	Returns: 
-		np.array: Adjacency matrix containing shortest distance between all components
+		pts (np.array): Flat (M, 2) table of every component point coordinate
+		labels (np.array): Component # per point; sorted, so every component
+			is one contiguous run of the table
+
+	Returns:
+		np.array: Matrix of shortest distances between all components
+		np.array: Matrix of start point indices (into the point table) per pair
+		np.array: Matrix of end point indices (into the point table) per pair
 	"""
-	
-	size = len(trees.keys())
-	adjacency = np.zeros(shape=(size, size)).astype(tuple)
-	
-	i, j = 0, 0
-	comps = list(components.keys())
-	
-	
+
+	#Renumber the component #s 0..N-1 and find where each component's
+	# contiguous run of the point table starts
+	ptComp = np.unique(labels, return_inverse=True)[1].astype(np.int32)
+	size = int(ptComp[-1]) + 1 if len(ptComp) else 0
+
+	compOffsets = np.concatenate(
+		([0], np.cumsum( np.bincount(ptComp, minlength=size) )))
+
+	#Three parallel matrices instead of one matrix of Python tuples: the
+	# distances stay a real float array (so Prim can index it cheaply) and
+	# the endpoints are indices into the point table.
+	#Component pairs with no near-neighbor candidates keep an inf distance,
+	# which Prim's algorithm below will never pick over a real edge
+	dist = np.full(shape=(size, size), fill_value=np.inf, dtype=np.float32)
+	startIdx = np.zeros(shape=(size, size), dtype=np.int32)
+	endIdx = np.zeros(shape=(size, size), dtype=np.int32)
+
+
+	#With fewer than two components there is nothing to connect (and a
+	# single-pixel image would squeeze the k=1 query results to 1-D below)
+	if (size < 2):
+		return dist, startIdx, endIdx
+
+
+	#Pad the label table so the out-of-range index scipy uses for missing
+	# neighbors maps to a component # that never matches
+	ptCompPadded = np.append(ptComp, -1)
+
+	#Build one global 2d-tree over every edge pixel. The tree is built once
+	# and queried a handful of times, so skip the sliding-midpoint balancing
+	# and node compaction passes and use bigger leaves: cheaper to build,
+	# and 2-D pixel data is uniform enough that queries barely notice
+	globalTree = spatial.cKDTree(pts, leafsize=32,
+								 balanced_tree=False, compact_nodes=False)
+
+
 	#For every component
-	for i, startingComp in enumerate(comps):
-		coords = components[startingComp]
-		#print("Querying from component", startingComp)
-		
-		#Find closest points between this component and    lst: 1, *3*, 7, 11, 9, 2
-		#those components ahead of it in the list					  | ->
-		for j in range(i+1, len(comps)):
-			endingComp = comps[j]
-			tree = trees[endingComp]
-			
-			#Query tree with each point from startingComp
-			distances, indices = tree.query(coords, k=1)
-			
-			#Find the index of the shortest distance
-			minDistanceIndex = np.argmin(distances)
-			minDistance = distances[minDistanceIndex]
-			
-			#Find the respective points
-			start = coords[minDistanceIndex]
-			end = tree.data[ indices[minDistanceIndex] ].astype(int)
-			
-			
-			#Add these points to the adjacency list
-			adjacency[i][j]= adjacency[j][i]= (tuple(start),tuple(end),minDistance)
-	
-	
-	return adjacency
+	for i in range(size):
+		coords = pts[ compOffsets[i] : compOffsets[i+1] ]
+		#print("Querying from component", i)
+
+		#Query the global tree with all of this component's points at once,
+		# doubling k until every point has found a pixel outside its own
+		# component (only same-component pixels can crowd the neighbor list)
+		k = min(2, len(pts))
+		while True:
+			#workers=-1 spreads the batched query across all cores
+			distances, indices = globalTree.query(coords, k=k, workers=-1)
+
+			foreign = (ptCompPadded[indices] != i) & np.isfinite(distances)
+
+			if (foreign.any(axis=1).all() or k >= len(pts)):
+				break
+			k = min(k * 2, len(pts))
+
+		#Mask out same-component hits
+		startIndices = np.repeat(np.arange(len(coords)), k)[foreign.ravel()]
+		endIndices = indices[foreign]
+		distances = distances[foreign]
+
+		endComps = ptComp[endIndices]
+
+
+		#For each neighboring component, keep only the closest candidate
+		# pair: sort candidates by (component #, distance) and take the
+		# head of each component's group
+		order = np.lexsort((distances, endComps))
+		groupComps, groupStarts = np.unique(endComps[order], return_index=True)
+		best = order[groupStarts]
+
+		for j, b in zip(groupComps, best):
+			minDistance = distances[b]
+
+			#Keep the shorter of this candidate and the reverse-direction
+			# candidate found from component j's own query
+			if (minDistance < dist[i][j]):
+				dist[i][j] = dist[j][i] = minDistance
+
+				startIdx[i][j]= endIdx[j][i]= compOffsets[i] + startIndices[b]
+				endIdx[i][j]= startIdx[j][i]= endIndices[b]
+
+
+	#The candidate graph above can come out disconnected: clusters of
+	# components that sit far apart may never show up in each other's
+	# neighbor lists. Stitch the clusters together Boruvka-style (closest
+	# pixel pair from each cluster to any other cluster) so the spanning
+	# tree downstream can actually span
+	while True:
+		finite = np.where(np.isfinite(dist), dist, 0)
+		numGroups, compGroup = csgraph.connected_components(
+			sparse.csr_matrix(finite), directed=False)
+
+		if (numGroups < 2):
+			break
+
+		ptGroup = compGroup[ptComp]
+
+		#For every cluster of components...
+		for g in range(numGroups):
+			own = (ptGroup == g)
+
+			queryIdx = np.flatnonzero(own)
+			otherIdx = np.flatnonzero(~own)
+
+			if (len(otherIdx) == 0):
+				continue
+
+			#Find the closest pixel outside this cluster by querying a tree
+			# built over everything *but* the cluster with k=1. Doubling k on
+			# the global tree instead would have to climb past every
+			# same-cluster pixel closer than the gap being bridged, which gets
+			# expensive fast for big, well-separated clusters
+			otherTree = spatial.cKDTree(pts[otherIdx], leafsize=32,
+										balanced_tree=False,
+										compact_nodes=False)
+
+			distances, indices = otherTree.query(pts[queryIdx], k=1,
+												 workers=-1)
+
+			#Take the closest discovered pair and add it as an edge
+			# between the two components it joins
+			b = int(np.argmin(distances))
+
+			startI = queryIdx[b]
+			endI = otherIdx[indices[b]]
+
+			i, j = ptComp[startI], ptComp[endI]
+
+			if (distances[b] < dist[i][j]):
+				dist[i][j] = dist[j][i] = distances[b]
+
+				startIdx[i][j]= endIdx[j][i]= startI
+				endIdx[i][j]= startIdx[j][i]= endI
+
+
+	return dist, startIdx, endIdx
 
 
 #------------------------------------------------------------------------------
 
 
-def dist_to_MST(adjacency):
-	"""Build an MST using an adjacency matrix containing distances
-	
-	Using the adjacency matrix from the last step, create a minimum spanning 
+def dist_to_MST(dist):
+	"""Build an MST using a matrix of distances
+
+	Using the distance matrix from the last step, create a minimum spanning
 	 tree with distance as the edge cost
-	
-	The below is Prim's algorithm
-	
-	
+
+	The below is the array form of Prim's algorithm: instead of rescanning
+	 every (visited, unvisited) pair per step, keep the cheapest known edge
+	 into each unvisited vertex and relax it with one vectorized pass when a
+	 vertex joins the tree
+
+
 	Args:
-		adjacency (np.array): Adjacency matrix containing shortest distance between all components
-	
-	Returns: 
-		list: Minimum Spanning Tree containing connected component distances
+		dist (np.array): Matrix of shortest distances between all components
+
+	Returns:
+		np.array: Minimum Spanning Tree edges, (N-1, 2) of component indices
 	"""
-	
-	numVertices = len(adjacency)
-	visited = [False] * numVertices
-	numEdges = 0
-	
+
+	numVertices = len(dist)
+
 	#List to store the MST
 	MST = []
-	
-	
-	#Set the first vertex to 'visited'
-	visited[0] = True
-	
-	while (numEdges < numVertices - 1):
-		min = sys.maxsize
-		x = 0
-		y = 0
-		
-		for i in range(numVertices):
-			if (visited[i]):
-				
-				for j in range(numVertices):
-					if (not visited[j]):
-						if (min > adjacency[i][j][2]):
-							min = adjacency[i][j][2]
-							x = i
-							y = j
-		
-		
-		MST.append(adjacency[x][y])
-		visited[y] = True
-		numEdges += 1
-	
-	return MST
+
+	if (numVertices < 2):
+		return np.empty((0, 2), dtype=np.int32)
+
+
+	#With many components the kNN distance matrix is sparse (missing pairs
+	# are inf), so let scipy's C-level Kruskal chew on the sparse graph
+	# instead; the dense Prim below only wins when the matrix is tiny
+	if (numVertices > 32):
+		graph = sparse.csr_matrix(np.where(np.isfinite(dist), dist, 0))
+		mst = csgraph.minimum_spanning_tree(graph)
+
+		srcs, dsts = mst.nonzero()
+		return np.column_stack((srcs, dsts)).astype(np.int32)
+
+
+	#Cheapest known edge into each unvisited vertex, and which visited
+	# vertex it comes from
+	key = dist[0].astype(np.float64)
+	parent = np.zeros(numVertices, dtype=np.int32)
+
+	#Start with the first vertex in the tree
+	inMST = np.zeros(numVertices, dtype=bool)
+	inMST[0] = True
+
+	for numEdges in range(numVertices - 1):
+		#Pick the unvisited vertex with the cheapest edge into the tree
+		y = int(np.argmin( np.where(inMST, np.inf, key) ))
+
+		MST.append((int(parent[y]), y))
+		inMST[y] = True
+
+		#Edges out of y may now be the cheapest way into the tree
+		candidates = dist[y]
+		better = (~inMST) & (candidates < key)
+
+		parent[better] = y
+		key[better] = candidates[better]
+
+	return np.array(MST, dtype=np.int32)
 
 
 #------------------------------------------------------------------------------
 
 
-def draw_connections(map, MST):
+def draw_connections(map, MST, startIdx, endIdx, pts):
 	"""Using an MST containing coordinates, draw lines from each connected coord
 	
 	Using the MST created above, draw lines along the edges between closest 
@@ -174,56 +274,68 @@ def draw_connections(map, MST):
 	
 	Args:
 		map (np.array): Map of numbered connected components
-		MST (list): Minimum Spanning Tree containing connected component distances
-	
-	Returns: 
+		MST (np.array): Minimum Spanning Tree edges, (N-1, 2) component indices
+		startIdx (np.array): Matrix of start point indices per component pair
+		endIdx (np.array): Matrix of end point indices per component pair
+		pts (np.array): Flat (M, 2) table of every component point coordinate
+
+	Returns:
 		np.array: Map of edge pixels with connection lines drawn
 	"""
-	
+
+	#Collect the pixels of every line, then paint them all in one assignment
+	allRows = []
+	allCols = []
+
 	for edge in MST:
 		#Set up initial conditions
-		x1, y1 = edge[0]
-		x2, y2 = edge[1]
+		x1, y1 = pts[ startIdx[edge[0]][edge[1]] ]
+		x2, y2 = pts[ endIdx[edge[0]][edge[1]] ]
 		dx = x2 - x1
 		dy = y2 - y1
-		
+
 		#Determine if the line slopes vertically or horizontally
 		slopedVertically = abs(dy) > abs(dx)
-		
-		
-		
+
+
+
 		#Rotate if vertically sloped
 		if (slopedVertically):
 			x1, y1 = y1, x1
 			x2, y2 = y2, x2
-		
+
 		#Swap points to keep things positive
 		if (x1 > x2):
 			x1, x2 = x2, x1
 			y1, y2 = y2, y1
-		
-		
+
+
 		#Recalculate slopes
 		dx = x2 - x1
 		dy = y2 - y1
-		
-		#Calculate error
-		error = int(dx / 2)
+
 		ystep = 1 if (y1 < y2) else -1
-		
-		#Generate points
-		y = y1
-		for x in range(x1, x2+1):
-			
-			if (slopedVertically):
-				map[y][x] = 255
-			else:
-				map[x][y] = 255
-			
-			error -= abs(dy)
-			if (error < 0):
-				y += ystep
-				error += dx
+
+		#Generate points. This is the closed form of Bresenham's error
+		# accumulation: after t steps the line has moved
+		# floor((t*|dy| + (dx-1)//2) / dx) times in y
+		xs = np.arange(x1, x2+1)
+
+		if (dx > 0):
+			ys = y1 + ystep * ((np.arange(dx+1) * abs(dy) + (dx-1)//2) // dx)
+		else:
+			ys = np.full(1, y1)
+
+		if (slopedVertically):
+			allRows.append(ys)
+			allCols.append(xs)
+		else:
+			allRows.append(xs)
+			allCols.append(ys)
+
+
+	if (len(allRows) > 0):
+		map[np.concatenate(allRows), np.concatenate(allCols)] = 255
 
 	return map
 	
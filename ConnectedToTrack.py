@@ -1,49 +1,27 @@
-from collections import deque 
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph  #For breadth_first_order
 
+from _kernels import postorder_walk, farthest_leaf_pass, track_walk
 
-# To store image pixel cordinates 
-class Point: 
-	def __init__(self, r: int, c: int): 
+
+# To store image pixel cordinates
+class Point:
+	def __init__(self, r: int, c: int):
 		self.r = r	#Row
 		self.c = c 	#Col
 
 
-class Node:
-	def __init__(self, pt: Point):
-		self.pt = pt		#The point in the image this represents
-		self.children = []	#Points that followed this one in BFS
-		self.depth = -1		#Depth of this node in the tree	
-		self.farthestLeaf = -1	#Distance to farthest leaf node from this node
-		self.parent = None
-	
-	
-	def __str__(self):
-		ret = "({}, {})".format(self.pt.r, self.pt.c)
-		return ret
-		
-	def brack(self):
-		ret = "[{}, {}]".format(self.pt.r, self.pt.c)
-		return ret
-	
-	def norm(self):
-		ret = "{} {}".format(self.pt.r, self.pt.c)
-		return ret
-		
-		
-	def __repr__(self, depth=0):
-		ret = ": "*depth+"({}, {}) {}".format(self.pt.r, self.pt.c, self.farthestLeaf)+"\n"
-		for child in self.children:
-			ret += child.__repr__(depth+1)
-		return ret
-
-
-#Is this point in bounds
-def inBounds(row: int, col: int, ROW: int, COL: int):
-	return (row >= 0) and (row < ROW) and (col >= 0) and (col < COL)
-
-
-# These arrays are used to get row and column  
-# numbers of 8 neighbours of a given cell  
+# The BFS tree is stored as parallel arrays rather than one object per pixel
+# (struct-of-arrays): node i's pixel is (row[i], col[i]), its parent is
+# parent[i] (-1 for the root), and its children are
+# childIdx[ childStart[i] : childStart[i+1] ], in BFS discovery order.
+# Nodes are numbered in BFS visit order, so the root is node 0 and parents
+# always come before their children.
+
+
+# These arrays are used to get row and column
+# numbers of 8 neighbours of a given cell
 ROWDELTA = [-1, -1, -1,
 			 0,      0,
 			 1,  1,  1]
@@ -57,201 +35,199 @@ COLDELTA = [-1,  0,  1,
 
 def BFS(img, start: Point):
 	"""Visit all pixels via BFS
-	
-	Run BFS on the map of connected pixels to represent drawing the image 
-	 without lifting your pencil. 
-	
-	BFS rather than DFS ensures we get adjacent pixels first rather than 
+
+	Run BFS on the map of connected pixels to represent drawing the image
+	 without lifting your pencil.
+
+	BFS rather than DFS ensures we get adjacent pixels first rather than
 	 reaching the end and then having to retrace for one pixel at the beginning
-	
+
+	Rather than scanning the 8 neighbors of every pixel in Python, build a
+	 sparse 8-connected graph over the edge pixels once (vectorized) and let
+	 scipy's C-level breadth_first_order do the traversal. The CSR column
+	 ordering visits neighbors in the same order as ROWDELTA/COLDELTA, so the
+	 resulting tree matches the old queue-based BFS
+
 	Args:
 		img (np.array): Map of connected pixels to be traced
 		start (Point): Starting point to begin BFS
-	
-	Returns: 
-		node: Root node of our BFS tree
+
+	Returns:
+		dict: BFS tree as parallel arrays (see the layout note up top)
 		int: MaxDepth reached during BFS
 	"""
-	
+
 	ROW = len(img)
 	COL = len(img[0])
-	
-	visited = [[False for i in range(COL)] for j in range(ROW)] 
-	
-	#Mark the start pixel as visited
-	visited[start.r][start.c] = True
-	
-	#Create a queue to hold points to be visited
-	q = deque()
-	
-	node = Node(start)
-	
-	#Enqueue and set this node to the root of our BFS result tree
-	q.append(node)
-	root = node
-	root.depth = 0
-	
-	#Keep track of the maximum depth
+
+	#Number the edge pixels in a flattened view of the image: pixelNum[f]
+	# is the vertex # of the pixel at flat index f = r*COL + c
+	edgeMask = np.asarray(img) > 0
+	coords = np.argwhere(edgeMask).astype(np.int32)
+
+	flatIdx = coords[:, 0] * COL + coords[:, 1]
+
+	pixelNum = np.full(ROW * COL, -1, dtype=np.int32)
+	pixelNum[flatIdx] = np.arange(len(coords), dtype=np.int32)
+
+	#In the flattened image each of the 8 neighbors is one fixed offset away
+	neighborOffsets = np.array(
+		[ROWDELTA[i] * COL + COLDELTA[i] for i in range(8)], dtype=np.int32)
+
+
+	#Build the 8-connected adjacency between edge pixels, one neighbor
+	# direction at a time (each direction is one vectorized shift)
+	srcs = []
+	dsts = []
+
+	for i in range(8):
+		nbr = flatIdx + neighborOffsets[i]
+
+		#In bounds means inside the flat image without wrapping a row edge
+		cols = coords[:, 1] + COLDELTA[i]
+		inBnds = (nbr >= 0) & (nbr < ROW * COL) & (cols >= 0) & (cols < COL)
+
+		src = np.arange(len(coords), dtype=np.int32)[inBnds]
+		dst = pixelNum[nbr[inBnds]]
+
+		#Keep only neighbors that are edge pixels themselves
+		srcs.append(src[dst >= 0])
+		dsts.append(dst[dst >= 0])
+
+	srcs = np.concatenate(srcs)
+	dsts = np.concatenate(dsts)
+
+	adjacency = sparse.csr_matrix(
+		(np.ones(len(srcs), dtype=np.int8), (srcs, dsts)),
+		shape=(len(coords), len(coords)))
+
+
+	#Run the BFS itself in C
+	startNum = pixelNum[start.r * COL + start.c]
+	order, preds = csgraph.breadth_first_order(
+		adjacency, startNum, directed=False, return_predecessors=True)
+
+
+	#Renumber vertices by visit order so the root is node 0 and parents
+	# always come before their children
+	numNodes = len(order)
+
+	rank = np.full(len(coords), -1, dtype=np.int32)
+	rank[order] = np.arange(numNodes, dtype=np.int32)
+
+	parent = np.empty(numNodes, dtype=np.int32)
+	parent[0] = -1
+	parent[1:] = rank[ preds[order[1:]] ]
+
+	#Group each node's children CSR-style, keeping BFS discovery order
+	childIdx = np.argsort(parent[1:], kind="stable").astype(np.int32) + 1
+	childStart = np.concatenate(
+		([0], np.cumsum( np.bincount(parent[1:], minlength=numNodes) ))
+		).astype(np.int32)
+
+	#Depth per node: BFS visits whole levels in order, so each level is a
+	# contiguous run of nodes whose parents lie in the previous run
+	depth = np.zeros(numNodes, dtype=np.int32)
 	maxDepth = 0
+	levelEnd = 1
+
+	while (levelEnd < numNodes):
+		nextEnd = 1 + np.searchsorted(parent[1:], levelEnd)
+
+		maxDepth += 1
+		depth[levelEnd:nextEnd] = maxDepth
+		levelEnd = nextEnd
+
 
+	tree = {
+		"row": coords[order, 0],
+		"col": coords[order, 1],
+		"depth": depth,
+		"parent": parent,
+		"farthestLeaf": np.full(numNodes, -1, dtype=np.int32),
+		"childStart": childStart,
+		"childIdx": childIdx,
+	}
 
-	#While the queue still has more nodes...
-	while q:
-		#Dequeue the next point
-		curr = q.popleft()
-		
-		#Enqueue the adjacent points
-		for i in range(8):
-			#Calculate the coordinates of the next point
-			row = curr.pt.r + ROWDELTA[i]
-			col = curr.pt.c + COLDELTA[i]
-			
-			
-			#If this point is in bounds, is a valid edge,
-			#and hasn't been visited yet...
-			if(inBounds(row, col, ROW, COL) and (img[row][col] > 0) and (not visited[row][col])):
-				visited[row][col] = True
-				adjPoint = Node(Point(row, col))
-				adjPoint.depth = curr.depth+1	#Update our depth
-				
-				maxDepth = max(maxDepth, adjPoint.depth)
-				
-				#Enqueue it and add it to the tree
-				q.append(adjPoint)
-				curr.children.append(adjPoint)
-				adjPoint.parent = curr
-	
-	
-	return root, maxDepth
+	return tree, maxDepth
 
 
 #------------------------------------------------------------------------------
 
 
-def postorder(root: Node):
-	"""Postorder traversal recording farthest child depth and sorting tree
-	
-	Perform a postorder traversal, record farthest child depth and sort node 
-	 children on that rather than printing as a usual postorder would
-	
-	
+def postorder(tree):
+	"""Postorder traversal of the BFS tree
+
+	Produce the traversal stack that sort_tree below consumes: every node
+	 appears after its parent, so walking the stack in reverse sees all
+	 children before their parent
+
+
 	Args:
-		root (Node): BFS tree to perform postorder traversal on
-	
-	Returns: 
-		list: Postorder traversal result stack
+		tree (dict): BFS tree as parallel arrays
+
+	Returns:
+		np.array: Postorder traversal result stack of node indices
 	"""
-	
-	#Create stacks for postorder traversal
-	stack = [] 
-	stack2 = []
-	
-	#Add the root node to the stack
-	stack.append(root) 
-	
-	while(len(stack)): 
-		#Pop the next node
-		curr = stack.pop()
-		stack2.append(curr)
-		children = curr.children
-		
-		for child in children:
-			stack.append(child)
-	
-	return stack2
+
+	return postorder_walk(tree["childStart"], tree["childIdx"])
 
 
 #------------------------------------------------------------------------------
 
 
-def sort_tree(stack: list): 
+def sort_tree(stack, tree):
 	"""Sort a BFS tree using its postorder traversal
-	
-	As the postorder traversal of a BFS contains references to each node in a 
-	 BFS, simply sort the BFS using the postorder stack
-	
+
+	Record each node's distance to its farthest leaf (compiled reverse
+	 postorder pass), then reorder every node's children so the child
+	 subtrees with the farthest leaves come first — done for all nodes at
+	 once with a single stable lexsort by (parent, -farthestLeaf) instead
+	 of one Python sorted() per internal node
+
 	Args:
-		stack (list): Postorder traversal result stack, contains node references
+		stack (np.array): Postorder traversal result stack of node indices
+		tree (dict): BFS tree as parallel arrays, sorted in place
 	"""
-	
-	#Stack holds the postorder traversal of our tree
-	stack.reverse()
-	
-	for node in stack:
-		if (len(node.children) == 0):
-			node.farthestLeaf = 0
-		
-		node.children = sorted(node.children, key=lambda child: child.farthestLeaf, reverse=True)
-		
-		parent = node.parent
-		
-		#If this is the root node, we're done
-		if (node.parent == None):
-			return
-		
-		parent.farthestLeaf = max(node.farthestLeaf + 1, parent.farthestLeaf)
+
+	parent = tree["parent"]
+	farthestLeaf = tree["farthestLeaf"]
+	childIdx = tree["childIdx"]
+
+	farthest_leaf_pass(stack, parent, farthestLeaf, tree["childStart"])
+
+	#childIdx is grouped by parent, so a stable sort on (parent, -distance)
+	# keeps the groups in place while ordering each one by distance; ties
+	# keep their BFS discovery order, same as the old per-node stable sort
+	order = np.lexsort((-farthestLeaf[childIdx], parent[childIdx]))
+
+	tree["childIdx"] = childIdx[order]
 
 
 #------------------------------------------------------------------------------
 
 
-def tree_to_track(root: Node, maxDepth: int):
+def tree_to_track(tree, maxDepth: int):
 	"""Convert BFS tree to a cartesian Sisyphus table track
-	
+
 	Args:
-		root (Node): BFS tree to perform postorder traversal on
-		maxDepth (int): Maximum depth of the BFS tree 'root'
-	
-	Returns: 
+		tree (dict): BFS tree as parallel arrays
+		maxDepth (int): Maximum depth of the BFS tree
+
+	Returns:
 		list: List of cartesian coordinates for the table to draw
 	"""
-	
-	TRACK = []
-	
-	stack = []
-	stack.append(root)
-	
-	goingUp = False	#If True and the current node has children, dont print
-	existsChildAbove = None
-	
-	
-	while(len(stack)):
-		curr = stack[len(stack)-1]
-		children = curr.children
-		
-		#The existence of an untouched child will tell us not to stop 
-		# if we reach maxDepth
-		if(curr == existsChildAbove):
-			existsChildAbove = None
-		
-		if(len(children) > 1 and existsChildAbove is None):
-			existsChildAbove = children[0]
-		
-		
-		#If we're not moving upward to a node with children...
-		if(not(goingUp and len(children))):
-			ret = ": "*(len(stack)-1)+"{}".format(curr)
-			#TRACK.append(Node.brack(curr))
-			TRACK.append(Node.norm(curr))
-	
-	
-	
-		#If this node has more children...
-		if (len(children) > 0):
-			#Move the last child to the stack
-			stack.append(children.pop())
-			goingUp = False
-				
-		
-		else: #Remove it
-			stack.pop()
-			goingUp = True
-	
-			#If we've reached maxDepth and touched all nodes, we're done
-			if (curr.depth == maxDepth-1 and existsChildAbove is None):
-				break
-				
-		
+
+	#The walk itself is sequential, so it lives in a compiled kernel; only
+	# the string formatting stays out here
+	visitOrder = track_walk(tree["depth"], tree["childStart"],
+							tree["childIdx"], maxDepth)
+
+	row = tree["row"]
+	col = tree["col"]
+
+	TRACK = ["{} {}".format(row[i], col[i]) for i in visitOrder]
+
 	return TRACK
 
 
@@ -259,53 +235,60 @@ def tree_to_track(root: Node, maxDepth: int):
 
 
 def find_start(img):
-	"""Find the best coordinate to start BFS 
-	
-	Find the closest pixel to the edge of the image as a coord to start the 
-	 marble from. Circle clockwise around the image until an edge pixel is 
+	"""Find the best coordinate to start BFS
+
+	Find the closest pixel to the edge of the image as a coord to start the
+	 marble from. Circle clockwise around the image until an edge pixel is
 	 found, then return it
-	
+
 	Algorithm from https://www.geeksforgeeks.org/print-a-given-matrix-in-spiral-form/
-	
-	Because the binary image created earlier has no edge pixels on the 
+
+	Each side of a ring is a contiguous 1-D slice, so the per-pixel checks
+	 become one flatnonzero per side (scans that ran right-to-left or
+	 bottom-to-top just take the last hit instead of the first)
+
+	Because the binary image created earlier has no edge pixels on the
 	 outermost pixel ring, skip it
-	
-	
+
+
 	Args:
 		img (np.array): Image to find the starting point of
-	
-	Returns: 
+
+	Returns:
 		Point: Recommended starting point for BFS for the input image
 	"""
-	
+
 	l = 0 +1
 	k = 0 +1
 	m = len(img) -1
 	n = len(img[0]) -1
-	
+
 	while(k < m and l < n):
-		
-		#Check the top-most row
-		for i in range(l, n):
-			if(img[k][i] > 0):
-				return Point(k, i)
+
+		#Check the top-most row, left to right
+		nz = np.flatnonzero(img[k, l:n] > 0)
+		if(len(nz)):
+			return Point(k, l + nz[0])
 		k += 1
-		
-		for i in range(k, m):
-			if(img[i][n-1] > 0):
-				return Point(i, n-1)
+
+		#The right-most column, top to bottom
+		nz = np.flatnonzero(img[k:m, n-1] > 0)
+		if(len(nz)):
+			return Point(k + nz[0], n-1)
 		n -= 1
-		
+
 		if(k < m):
-			for i in range(n-1, l-1, -1):
-				if(img[m-1][i] > 0):
-					return Point(m-1, i)
+			#The bottom-most row, right to left
+			nz = np.flatnonzero(img[m-1, l:n] > 0)
+			if(len(nz)):
+				return Point(m-1, l + nz[-1])
 			m -= 1
-		
+
 		if(l < n):
-			for i in range(m-1, k-1, -1):
-				if(img[i][l] > 0):
-					return Point(i, l)
+			#The left-most column, bottom to top
+			nz = np.flatnonzero(img[k:m, l] > 0)
+			if(len(nz)):
+				return Point(k + nz[-1], l)
 			l += 1
-	
-	return -1
\ No newline at end of file
+
+	return -1
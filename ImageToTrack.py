@@ -40,34 +40,35 @@ edges = img_to_edges(image)
 #------------------------------------------------------------------------------
 # Connect disjoint line segments in edges image
 
-from ConnectedComponentTwoPass import *
-map, tags = number_connected_components(edges)
+import numpy as np
+from scipy import ndimage
 
-tags = consolidate_tags(tags)
-tags = trim_tags(tags)
+#Label 8-connected components, scipy runs the two-pass labeler in C
+map, numComponents = ndimage.label(edges, structure=np.ones((3, 3), dtype=bool))
 
-components = list_component_coords(map, tags)
+#Keep a single flat table of edge pixel coordinates plus a parallel
+#component label array, sorted so each component is one contiguous run;
+#everything downstream refers to int32 indices into this one table
+#int32 coordinates are plenty for any image and keep cKDTree input small
+pts = np.argwhere(map > 0).astype(np.int32)
+labels = map[pts[:, 0], pts[:, 1]]
+
+order = np.argsort(labels, kind="stable")
+pts = pts[order]
+labels = labels[order]
 
 
 #------------------------------------------------------------------------------
 # Connect all individual edge segments
 
 from ConnectComponents import *
-trees = build_cKDTree(components)
-
-adjacency = build_shortest_dist_matrix(components, trees)
-MST = dist_to_MST(adjacency)
-
-img = draw_connections(map, MST)
-
-
-#------------------------------------------------------------------------------
-# Brighten the resulting image
+dist, startIdx, endIdx = build_shortest_dist_matrix(pts, labels)
+MST = dist_to_MST(dist)
 
-for row in range(len(img)):
-	for col in range(len(img[0])):
-		if (img[row][col] > 0):
-			img[row][col] = 255
+#Draw onto a binary uint8 version of the map: component pixels become 255
+# up front and draw_connections writes 255, so no separate brightening pass
+# is needed (and uint8 halves the bandwidth of every later scan)
+img = draw_connections((map > 0).astype(np.uint8) * 255, MST, startIdx, endIdx, pts)
 
 
 #------------------------------------------------------------------------------
@@ -78,15 +79,15 @@ start = find_start(img)
 
 tree, maxDepth = BFS(img, start)
 stack = postorder(tree)
-sort_tree(stack)
+sort_tree(stack, tree)
 
 TRACK = tree_to_track(tree, maxDepth)
 
 
-#Save the track to a file
+#Save the track to a file, as one buffered write rather than one
+#write call per point
 with open("{}.txt".format(filename.rsplit(".", 1)[0]), "w") as filehandle:
-	for point in TRACK:
-		filehandle.write("%s\n" % point)
+	filehandle.write("\n".join(TRACK) + "\n")
 
 
 
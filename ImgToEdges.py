@@ -1,3 +1,4 @@
+import numpy as np
 import skimage
 from skimage import feature
 
@@ -14,10 +15,14 @@ def img_to_edges(image_gray, sigma=2.4, low_threshold=0.04, high_threshold=0.17)
 		low_threshold (int): Canny edge detection parameter (Optional)
 		high_threshold (int): Canny edge detection parameter (Optional)
 	
-	Returns: 
+	Returns:
 		np.array: Binary image representing edges from image_gray
 	"""
-	
+
+	#Canny works at whatever precision it is given; float32 is plenty for
+	#8-bit source images and halves the bandwidth of every filtering pass
+	image_gray = np.asarray(image_gray, dtype=np.float32)
+
 	#Perform Canny edge detection on the image
 	edges = skimage.feature.canny(
 	    image=image_gray,
@@ -0,0 +1,293 @@
+import numpy as np
+
+"""Compiled kernels for the tight integer loops that resist vectorization
+
+The tree walks in ConnectedToTrack are inherently sequential (each step
+depends on the last), so they can't become single NumPy expressions like the
+labeling and line-drawing passes did. They are pure integer arithmetic over
+flat arrays though, which is exactly what numba compiles well.
+
+numba is optional: without it the same functions run as plain Python
+(correct, just slower), so callers never need to care.
+"""
+
+try:
+	from numba import njit
+	HAVE_NUMBA = True
+
+except ImportError:
+	HAVE_NUMBA = False
+
+	def njit(*args, **kwargs):
+		#Pass-through decorator, covering both @njit and @njit(...) forms
+		if (len(args) == 1 and callable(args[0])):
+			return args[0]
+		return lambda func: func
+
+
+#------------------------------------------------------------------------------
+
+
+@njit(cache=True)
+def label_scan(edges, map, pairsA, pairsB):
+	"""First labeling pass over the edge image, in 64x64 tiles
+
+	Same scan as the original row-major double loop, but walked tile by
+	 tile so the hot rows of the label map stay resident in L1/L2 instead
+	 of being streamed out between touches of neighboring rows.
+
+	Neighbor reads look up and left, which is always already-written
+	 territory except for one case: the up-right read across a tile's right
+	 edge lands in a tile that hasn't run yet. Those seams are patched by
+	 seam_scan below.
+
+	Args:
+		edges (np.array): Binary image containing image edge pixels
+		map (np.array): Zeroed label map, filled in place
+		pairsA (np.array): Output buffer for equivalence pair left labels
+		pairsB (np.array): Output buffer for equivalence pair right labels
+
+	Returns:
+		int: Number of component #s handed out, plus one
+		int: Number of equivalence pairs recorded
+	"""
+
+	TILE = 64
+
+	ROW = edges.shape[0]
+	COL = edges.shape[1]
+
+	#Current component ID number
+	segment = 1
+	numPairs = 0
+
+	for tileRow in range(1, ROW-1, TILE):
+		for tileCol in range(1, COL-1, TILE):
+
+			#For every pixel in this tile...
+			for row in range(tileRow, min(tileRow+TILE, ROW-1)):
+				for col in range(tileCol, min(tileCol+TILE, COL-1)):
+
+					#If this is an edge pixel
+					if (edges[row, col] != 0):
+						#													1 2 3
+						#Check surrounding 8 pixels for already found		4 X .
+						#(non-0) pixels, disregard bottom right 4			. . .
+						for i in range(4):
+							if (i == 0):
+								pix = map[row-1, col-1]
+							elif (i == 1):
+								pix = map[row-1, col  ]
+							elif (i == 2):
+								pix = map[row-1, col+1]
+							else:
+								pix = map[row  , col-1]
+
+							if (pix != 0):
+
+								#If we haven't already found a value...
+								if (map[row, col] == 0):
+									map[row, col] = pix
+
+								#If this pix value isn't a duplicate, record it
+								elif (pix != map[row, col]):
+									pairsA[numPairs] = map[row, col]
+									pairsB[numPairs] = pix
+									numPairs += 1
+
+						#If there was no non-zero pixel in neighbors...
+						if (map[row, col] == 0):
+							map[row, col] = segment
+							segment += 1
+
+	return segment, numPairs
+
+
+#------------------------------------------------------------------------------
+
+
+@njit(cache=True)
+def seam_scan(map, pairsA, pairsB, numPairs):
+	"""Patch the equivalences the tiled scan misses at tile seams
+
+	When label_scan visits the last column of a tile, its up-right neighbor
+	 sits in the next tile over and hasn't been labeled yet, so that
+	 adjacency goes unrecorded. Walk each vertical seam once and record a
+	 pair wherever a pixel touches an up-right pixel with a different label
+	 (duplicates are harmless, the union-find just merges them again)
+
+	Args:
+		map (np.array): Label map filled by label_scan
+		pairsA (np.array): Output buffer for equivalence pair left labels
+		pairsB (np.array): Output buffer for equivalence pair right labels
+		numPairs (int): Number of pairs already recorded
+
+	Returns:
+		int: Updated number of equivalence pairs recorded
+	"""
+
+	TILE = 64
+
+	ROW = map.shape[0]
+	COL = map.shape[1]
+
+	#For the first column of every tile after the first...
+	for col in range(1+TILE, COL-1, TILE):
+		for row in range(2, ROW-1):
+
+			if (map[row, col-1] != 0 and map[row-1, col] != 0
+					and map[row, col-1] != map[row-1, col]):
+				pairsA[numPairs] = map[row, col-1]
+				pairsB[numPairs] = map[row-1, col]
+				numPairs += 1
+
+	return numPairs
+
+
+#------------------------------------------------------------------------------
+
+
+@njit(cache=True)
+def postorder_walk(childStart, childIdx):
+	"""Postorder traversal over a CSR-style children layout
+
+	Matches the two-stack postorder: pop a node, record it, push its
+	children in order (so the last child is popped first)
+
+	Args:
+		childStart (np.array): CSR offsets of each node's children
+		childIdx (np.array): Children of all nodes, grouped per node
+
+	Returns:
+		np.array: Postorder traversal result stack of node indices
+	"""
+
+	numNodes = len(childStart) - 1
+
+	stack = np.empty(numNodes, dtype=np.int32)
+	out = np.empty(numNodes, dtype=np.int32)
+
+	stack[0] = 0
+	top = 0
+	count = 0
+
+	while (top >= 0):
+		curr = stack[top]
+		top -= 1
+
+		out[count] = curr
+		count += 1
+
+		for i in range(childStart[curr], childStart[curr+1]):
+			top += 1
+			stack[top] = childIdx[i]
+
+	return out
+
+
+#------------------------------------------------------------------------------
+
+
+@njit(cache=True)
+def farthest_leaf_pass(stack, parent, farthestLeaf, childStart):
+	"""Record every node's distance to its farthest leaf
+
+	Walk the postorder stack in reverse (children before parents): leaves
+	 get 0, and every node bumps its parent's distance. Fills farthestLeaf
+	 in place
+
+	Args:
+		stack (np.array): Postorder traversal result stack of node indices
+		parent (np.array): Parent of each node (-1 for the root)
+		farthestLeaf (np.array): Distance to farthest leaf, filled in place
+		childStart (np.array): CSR offsets of each node's children
+	"""
+
+	for idx in range(len(stack)-1, -1, -1):
+		node = stack[idx]
+
+		if (childStart[node] == childStart[node+1]):
+			farthestLeaf[node] = 0
+
+		p = parent[node]
+
+		if (p >= 0 and farthestLeaf[node] + 1 > farthestLeaf[p]):
+			farthestLeaf[p] = farthestLeaf[node] + 1
+
+
+#------------------------------------------------------------------------------
+
+
+@njit(cache=True)
+def track_walk(depth, childStart, childIdx, maxDepth):
+	"""Walk the sorted BFS tree, emitting the order pixels are traced in
+
+	This is the traversal loop of tree_to_track: descend into each node's
+	last remaining child, skip re-printing nodes on the way back up, and
+	stop once the deepest level is reached with no untouched child left
+
+	Args:
+		depth (np.array): Depth of each node
+		childStart (np.array): CSR offsets of each node's children
+		childIdx (np.array): Children of all nodes, grouped per node
+		maxDepth (int): Maximum depth of the BFS tree
+
+	Returns:
+		np.array: Node indices in the order the track visits them
+	"""
+
+	numNodes = len(childStart) - 1
+
+	#Number of not-yet-visited children per node
+	numChildren = np.empty(numNodes, dtype=np.int32)
+	for i in range(numNodes):
+		numChildren[i] = childStart[i+1] - childStart[i]
+
+	stack = np.empty(numNodes, dtype=np.int32)
+	out = np.empty(2 * numNodes, dtype=np.int32)
+
+	stack[0] = 0
+	top = 0
+	count = 0
+
+	goingUp = False	#If True and the current node has children, dont print
+	existsChildAbove = -1
+
+
+	while (top >= 0):
+		curr = stack[top]
+		n = numChildren[curr]
+
+		#The existence of an untouched child will tell us not to stop
+		# if we reach maxDepth
+		if (curr == existsChildAbove):
+			existsChildAbove = -1
+
+		if (n > 1 and existsChildAbove == -1):
+			existsChildAbove = childIdx[ childStart[curr] ]
+
+
+		#If we're not moving upward to a node with children...
+		if (not(goingUp and n > 0)):
+			out[count] = curr
+			count += 1
+
+
+		#If this node has more children...
+		if (n > 0):
+			#Move the last child to the stack
+			top += 1
+			stack[top] = childIdx[ childStart[curr] + n - 1 ]
+			numChildren[curr] = n - 1
+			goingUp = False
+
+		else: #Remove it
+			top -= 1
+			goingUp = True
+
+			#If we've reached maxDepth and touched all nodes, we're done
+			if (depth[curr] == maxDepth-1 and existsChildAbove == -1):
+				break
+
+
+	return out[:count]